@@ -3,10 +3,12 @@ from __future__ import annotations
 import json
 import os
 import subprocess
+import threading
 import time
 import uuid
-from datetime import datetime, timedelta
-from typing import Any, Dict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
 
 import paho.mqtt.client as mqtt
 
@@ -14,11 +16,23 @@ BROKER = os.environ.get("MQTT_HOST", "broker.hivemq.com")
 PORT = int(os.environ.get("MQTT_PORT", "1883"))
 TOPIC = os.environ.get("MQTT_TOPIC", "lift/lobby/packages/print")
 
+# Scheduling: lower rank prints first. A job can pick its class with a payload
+# field (see PRIORITY_KEYS) or by publishing on f"{TOPIC}/<class>".
+PRIORITY_CLASSES = {"urgent": 0, "normal": 1, "bulk": 2}
+DEFAULT_PRIORITY = os.environ.get("DEFAULT_PRIORITY", "normal").strip().lower()
+# Seconds of queue wait that lift a job by one priority class (0 disables aging).
+AGING_SECONDS = float(os.environ.get("AGING_SECONDS", "30"))
+# What to do with a job that can no longer meet its deadline: "drop" or "demote".
+DEADLINE_POLICY = os.environ.get("DEADLINE_POLICY", "drop").strip().lower()
+if DEADLINE_POLICY not in ("drop", "demote"):
+    print(f"[listener] unknown DEADLINE_POLICY={DEADLINE_POLICY!r}, falling back to drop")
+    DEADLINE_POLICY = "drop"
+
 
 def on_connect(client, _userdata, _flags, rc):
     print(f"[listener] connected rc={rc}")
-    client.subscribe(TOPIC)
-    print(f"[listener] subscribed to {TOPIC}")
+    client.subscribe([(TOPIC, 0), (f"{TOPIC}/+", 0)])
+    print(f"[listener] subscribed to {TOPIC} and {TOPIC}/+")
 
 
 def _first_non_empty(data: Dict[str, Any], keys, default="") -> str:
@@ -43,6 +57,9 @@ TIMESTAMP_KEYS = ("timestamp", "time", "datetime", "date", "createdAt", "created
 NOTE_KEYS = ("note", "notes", "description", "details", "comment")
 PRODUCT_NAME_KEYS = ("product_name", "productName", "product", "name", "title", "label", "message", "text")
 PRODUCT_OBJ_NAME_KEYS = ("name", "product_name", "productName", "title")
+PRIORITY_KEYS = ("priority", "priorityClass", "priority_class")
+DEADLINE_KEYS = ("deadline", "printBy", "print_by")
+DEADLINE_SECONDS_KEYS = ("deadline_seconds", "deadlineSeconds", "ttl")
 
 
 def _parse_datetime(value: Any) -> datetime | None:
@@ -112,8 +129,8 @@ def _build_gs1_code(product_code: str, lot_number: str, expiry: datetime) -> str
     return f"01{gtin}17{expiry_str}10{lot}"
 
 
-def build_label_payload(raw: str) -> Dict[str, Any]:
-    data = json.loads(raw)
+def build_label_payload(raw: str | Dict[str, Any]) -> Dict[str, Any]:
+    data = json.loads(raw) if isinstance(raw, str) else raw
 
     if isinstance(data, dict) and "labelItems" in data:
         return data
@@ -199,28 +216,212 @@ def build_label_payload(raw: str) -> Dict[str, Any]:
     return {"qty": qty, "labelItems": label_items}
 
 
+def _priority_class(data: Dict[str, Any], topic: str) -> str:
+    value = _first_non_empty(data, keys=PRIORITY_KEYS, default="").lower()
+    if value.isdigit():
+        ranks = {rank: name for name, rank in PRIORITY_CLASSES.items()}
+        value = ranks.get(min(int(value), max(ranks)), "")
+    if value in PRIORITY_CLASSES:
+        return value
+
+    suffix = topic[len(TOPIC):].strip("/").lower() if topic.startswith(TOPIC) else ""
+    if suffix in PRIORITY_CLASSES:
+        return suffix
+
+    return DEFAULT_PRIORITY if DEFAULT_PRIORITY in PRIORITY_CLASSES else "normal"
+
+
+def _deadline(data: Dict[str, Any], received: float) -> float | None:
+    seconds = _first_non_empty(data, keys=DEADLINE_SECONDS_KEYS, default="")
+    if seconds:
+        try:
+            return received + float(seconds)
+        except ValueError:
+            pass
+
+    deadline_dt = None
+    for key in DEADLINE_KEYS:
+        value = data.get(key)
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            try:
+                value = float(value.strip())  # epoch seconds sent as a string
+            except ValueError:
+                pass
+        deadline_dt = _parse_datetime(value)
+        if deadline_dt:
+            break
+        print(f"[listener] ignoring unparseable {key}={value!r}")
+    if not deadline_dt:
+        return None
+    if deadline_dt.tzinfo is None:
+        deadline_dt = deadline_dt.replace(tzinfo=timezone.utc)
+    return deadline_dt.timestamp()
+
+
+@dataclass
+class PrintJob:
+    label_payload: Dict[str, Any]
+    priority: str
+    deadline: float | None = None
+    enqueued: float = field(default_factory=time.time)
+    seq: int = 0
+    # class the job arrived with; queue wait is reported under it even after demotion
+    submitted_priority: str = ""
+    # set on demotion so aging restarts instead of carrying over the old wait
+    demoted_at: float | None = None
+
+    def __post_init__(self):
+        if not self.submitted_priority:
+            self.submitted_priority = self.priority
+
+    @property
+    def copies(self) -> int:
+        try:
+            return max(1, int(self.label_payload.get("qty", 1)))
+        except (TypeError, ValueError):
+            return 1
+
+    def score(self, now: float) -> tuple[float, int]:
+        rank = float(PRIORITY_CLASSES[self.priority])
+        if AGING_SECONDS > 0:
+            aging_base = self.demoted_at if self.demoted_at is not None else self.enqueued
+            rank -= (now - aging_base) / AGING_SECONDS
+        return rank, self.seq
+
+
+@dataclass
+class ClassStats:
+    jobs: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    dropped: int = 0
+    demoted: int = 0
+
+
+class PrintScheduler:
+    """
+    Single-printer queue: the best-scored job (priority class minus aging)
+    runs next; jobs that cannot finish before their deadline are dropped or
+    demoted according to DEADLINE_POLICY.
+    """
+
+    def __init__(self):
+        self._jobs: List[PrintJob] = []
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._copy_estimate = 0.0
+        self.stats = {name: ClassStats() for name in PRIORITY_CLASSES}
+
+    def submit(self, job: PrintJob) -> None:
+        with self._cond:
+            self._seq += 1
+            job.seq = self._seq
+            self._jobs.append(job)
+            print(f"[listener] queued {job.priority} job #{job.seq} (depth={len(self._jobs)})")
+            self._cond.notify()
+
+    def _expired(self, job: PrintJob, now: float) -> bool:
+        # checked only between jobs, so the printer is idle and the job's own
+        # copies are all that stand between now and its deadline
+        return job.deadline is not None and now + self._copy_estimate * job.copies > job.deadline
+
+    def _next_job(self) -> PrintJob:
+        with self._cond:
+            while True:
+                while not self._jobs:
+                    self._cond.wait()
+                now = time.time()
+                for job in [j for j in self._jobs if self._expired(j, now)]:
+                    stats = self.stats[job.submitted_priority]
+                    if DEADLINE_POLICY == "demote":
+                        stats.demoted += 1
+                        job.priority = max(PRIORITY_CLASSES, key=PRIORITY_CLASSES.get)
+                        job.deadline = None
+                        job.demoted_at = now
+                        print(f"[listener] job #{job.seq} missed its deadline, demoted to {job.priority}")
+                    else:
+                        stats.dropped += 1
+                        self._jobs.remove(job)
+                        print(f"[listener] job #{job.seq} missed its deadline, dropped")
+                if not self._jobs:
+                    continue
+                job = min(self._jobs, key=lambda j: j.score(now))
+                self._jobs.remove(job)
+                return job
+
+    def _record(self, job: PrintJob, wait: float, duration: float) -> None:
+        stats = self.stats[job.submitted_priority]
+        stats.jobs += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        # smoothed time per copy, used to tell whether a deadline is still reachable
+        per_copy = duration / job.copies
+        if self._copy_estimate:
+            self._copy_estimate = 0.8 * self._copy_estimate + 0.2 * per_copy
+        else:
+            self._copy_estimate = per_copy
+        ran_as = f" (ran as {job.priority})" if job.priority != job.submitted_priority else ""
+        print(
+            f"[listener] {job.submitted_priority}{ran_as} wait={wait:.2f}s "
+            f"avg={stats.total_wait / stats.jobs:.2f}s max={stats.max_wait:.2f}s "
+            f"jobs={stats.jobs} dropped={stats.dropped} demoted={stats.demoted}"
+        )
+
+    def run(self) -> None:
+        while True:
+            job = self._next_job()
+            started = time.time()
+            try:
+                print_label(job.label_payload)
+            except Exception as exc:
+                print(f"[listener] error printing job #{job.seq}: {exc}")
+            self._record(job, started - job.enqueued, time.time() - started)
+
+    def start(self) -> None:
+        threading.Thread(target=self.run, name="print-scheduler", daemon=True).start()
+
+
+def print_label(label_payload: Dict[str, Any]) -> None:
+    rendered = json.dumps(label_payload)
+    res = subprocess.run(
+        ["python3", "/code/print.py", rendered],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    print(f"[printer.py stdout]\n{res.stdout}")
+    if res.stderr:
+        print(f"[printer.py stderr]\n{res.stderr}")
+    if res.returncode != 0:
+        print(f"[listener] printer.py exited with {res.returncode}")
+
+
+scheduler = PrintScheduler()
+
+
 def on_message(client, _userdata, msg):
     payload = msg.payload.decode(errors="ignore").strip()
     print(f"[listener] msg on {msg.topic}: {payload[:200]}")
     try:
-        label_payload = build_label_payload(payload)
-        rendered = json.dumps(label_payload)
-        res = subprocess.run(
-            ["python3", "/code/print.py", rendered],
-            capture_output=True,
-            text=True,
-            check=False,
+        received = time.time()
+        data = json.loads(payload)
+        label_payload = build_label_payload(data)
+        scheduler.submit(
+            PrintJob(
+                label_payload=label_payload,
+                priority=_priority_class(data, msg.topic),
+                deadline=_deadline(data, received),
+                enqueued=received,
+            )
         )
-        print(f"[printer.py stdout]\n{res.stdout}")
-        if res.stderr:
-            print(f"[printer.py stderr]\n{res.stderr}")
-        if res.returncode != 0:
-            print(f"[listener] printer.py exited with {res.returncode}")
     except Exception as exc:
         print(f"[listener] error handling message: {exc}")
 
 
 def main():
+    scheduler.start()
     while True:
         try:
             client = mqtt.Client()
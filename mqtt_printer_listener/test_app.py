@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+
+import app  # noqa: E402
+
+
+def _submit(scheduler, priority, enqueued, deadline=None, qty=1):
+    job = app.PrintJob(label_payload={"qty": qty}, priority=priority, deadline=deadline, enqueued=enqueued)
+    scheduler.submit(job)
+    return job
+
+
+def test_demoted_job_yields_to_fresh_work(monkeypatch):
+    monkeypatch.setattr(app, "DEADLINE_POLICY", "demote")
+    monkeypatch.setattr(app, "AGING_SECONDS", 30.0)
+    scheduler = app.PrintScheduler()
+    now = time.time()
+
+    late = _submit(scheduler, "urgent", enqueued=now - 90, deadline=now - 1)
+    urgent = _submit(scheduler, "urgent", enqueued=now)
+    normal = _submit(scheduler, "normal", enqueued=now)
+
+    assert scheduler._next_job() is urgent
+    assert late.priority == "bulk"
+    assert scheduler._next_job() is normal
+    assert scheduler._next_job() is late
+
+    assert scheduler.stats["urgent"].demoted == 1
+    scheduler._record(late, wait=90.0, duration=0.1)
+    assert scheduler.stats["urgent"].jobs == 1
+    assert scheduler.stats["bulk"].jobs == 0
+
+
+def test_aging_lets_old_bulk_job_overtake(monkeypatch):
+    monkeypatch.setattr(app, "AGING_SECONDS", 30.0)
+    scheduler = app.PrintScheduler()
+    now = time.time()
+
+    old_bulk = _submit(scheduler, "bulk", enqueued=now - 100)
+    _submit(scheduler, "urgent", enqueued=now)
+
+    assert scheduler._next_job() is old_bulk
+
+
+def test_expired_deadline_is_dropped(monkeypatch):
+    monkeypatch.setattr(app, "DEADLINE_POLICY", "drop")
+    scheduler = app.PrintScheduler()
+    now = time.time()
+
+    _submit(scheduler, "urgent", enqueued=now, deadline=now - 1)
+    normal = _submit(scheduler, "normal", enqueued=now)
+
+    assert scheduler._next_job() is normal
+    assert scheduler.stats["urgent"].dropped == 1
+
+
+def test_large_job_does_not_expire_short_deadline(monkeypatch):
+    monkeypatch.setattr(app, "DEADLINE_POLICY", "drop")
+    scheduler = app.PrintScheduler()
+    now = time.time()
+
+    bulk = _submit(scheduler, "bulk", enqueued=now, qty=200)
+    assert scheduler._next_job() is bulk
+    scheduler._record(bulk, wait=0.0, duration=90.0)
+
+    urgent = _submit(scheduler, "urgent", enqueued=now, deadline=now + 60)
+    assert scheduler._next_job() is urgent
+    assert scheduler.stats["urgent"].dropped == 0
+
+
+def test_deadline_accounts_for_copies(monkeypatch):
+    monkeypatch.setattr(app, "DEADLINE_POLICY", "drop")
+    scheduler = app.PrintScheduler()
+    now = time.time()
+
+    first = _submit(scheduler, "normal", enqueued=now, qty=10)
+    assert scheduler._next_job() is first
+    scheduler._record(first, wait=0.0, duration=20.0)
+
+    _submit(scheduler, "urgent", enqueued=now, deadline=now + 60, qty=100)
+    normal = _submit(scheduler, "normal", enqueued=now)
+    assert scheduler._next_job() is normal
+    assert scheduler.stats["urgent"].dropped == 1
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        ({"ttl": 5}, 105.0),
+        ({"deadline": 1760000000}, 1760000000.0),
+        ({"deadline": "1760000000"}, 1760000000.0),
+        ({"deadline": "2026-01-01T00:00:00Z"}, 1767225600.0),
+        ({"deadline": "not a date"}, None),
+        ({}, None),
+    ],
+)
+def test_deadline_parsing(data, expected):
+    assert app._deadline(data, received=100.0) == expected
+
+
+def test_priority_from_payload_or_topic():
+    assert app._priority_class({"priority": "URGENT"}, app.TOPIC) == "urgent"
+    assert app._priority_class({"priority": 2}, app.TOPIC) == "bulk"
+    assert app._priority_class({}, f"{app.TOPIC}/urgent") == "urgent"
+    assert app._priority_class({}, f"{app.TOPIC}/Urgent") == "urgent"
+    assert app._priority_class({}, app.TOPIC) == "normal"
@@ -42,8 +42,9 @@ class QRPrint():
                 qr.add_data(datTry)
                 qr.make(fit=True)
                 img = qr.make_image(fill_color="black", back_color="white")
-                imgNew = "qr_temp" + str(i) + ".png"
-                img.save("qr_temp" + str(i) + ".png")
+                # keep chunk files next to the output so concurrent jobs don't share them
+                imgNew = os.path.splitext(fileName)[0] + "-part" + str(i) + ".png"
+                img.save(imgNew)
                 img = ""
                 
                 if i > 0:
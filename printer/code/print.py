@@ -3,6 +3,11 @@ import os
 import sys
 import json
 import time
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
 
 import barcode
@@ -31,22 +36,29 @@ MODEL = os.getenv("PRINTER_MODEL", "QL-700")
 TAPE = os.getenv("PRINTER_TAPE", "62")  # DK-62mm continuous
 IDENTIFIER = os.getenv("PRINTER_IDENTIFIER", "usb://0x04f9:0x2042")  # your QL-700 VID:PID
 QR_OVERLAY_TEXT = os.getenv("QR_OVERLAY_TEXT", "Digital Hospitals").strip()
+# Worker processes used to render barcode/QR items; 1 keeps rendering in-process, 0 uses every core.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
 # Note: we DON'T pass backend kwarg to send(); usb:// implies pyusb backend in your install.
 
 # Paths (match your mounted /code)
 BASE = Path(os.getenv("CODE_BASE", "/code"))
-BARCODES_DIR = BASE / "barcodes"
-QR_DIR = BASE / "QR"
-OUTPUT_DIR = BASE / "output"
+# every job renders into its own JOBS_DIR/<job id>/ so concurrent jobs never share files
+JOBS_DIR = BASE / "jobs"
 FONTS_DIR = BASE / "fonts"
 FONT_PATH = FONTS_DIR / "DejaVuSans-Bold.ttf"
 
 # QL-700 62mm tape raster width in pixels (approx 696 px)
 MAX_LABEL_WIDTH = 696
 
+# Finished job directories to keep for inspection (0 removes each job once printed)
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "10"))
+# Unfinished jobs whose owner process is gone and whose heartbeat is older than this are removed
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "3600"))
+JOB_DONE_MARKER = ".done"
+JOB_ACTIVE_MARKER = ".active"  # holds the owner pid; touched as a heartbeat while the job runs
+
 def ensure_dirs():
-    for p in [BARCODES_DIR, QR_DIR, OUTPUT_DIR]:
-        p.mkdir(parents=True, exist_ok=True)
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
 
 def log(msg: str):
     print(f"[print.py] {msg}", flush=True)
@@ -119,6 +131,13 @@ LINE_GAP = 8
 BOTTOM_PAD = 8
 MAX_LABEL_WIDTH = 696  # QL-700 62mm
 
+def fit_label_width(img: Image.Image) -> Image.Image:
+    # scale down if wider than tape
+    if img.width > MAX_LABEL_WIDTH:
+        r = MAX_LABEL_WIDTH / img.width
+        img = img.resize((MAX_LABEL_WIDTH, max(1, int(img.height * r))), Image.ANTIALIAS)
+    return img
+
 def create_label(barcode_items, text_items, qr_items, output_path: Path):
     log("Composing label image...")
 
@@ -127,14 +146,18 @@ def create_label(barcode_items, text_items, qr_items, output_path: Path):
     max_barcode_w = 0
     max_qr_w = 0
 
+    # items rendered by process_payload carry their finished image (captioned and tape-width)
     for it in barcode_items:
-        img = Image.open(f"{it['imgPath']}.png")
+        img = it.get("image")
+        if img is None:
+            img = Image.open(f"{it['imgPath']}.png")
         barcode_imgs.append(img)
         max_barcode_w = max(max_barcode_w, img.width)
 
     for it in qr_items:
-        img = Image.open(f"{it['imgPath']}.png")
-        img = overlay_text_on_qr(img, QR_OVERLAY_TEXT)
+        img = it.get("image")
+        if img is None:
+            img = overlay_text_on_qr(Image.open(f"{it['imgPath']}.png"), QR_OVERLAY_TEXT)
         qr_imgs.append(img)
         max_qr_w = max(max_qr_w, img.width)
 
@@ -197,10 +220,7 @@ def create_label(barcode_items, text_items, qr_items, output_path: Path):
 
     def paste_center(img):
         nonlocal y
-        # scale down if wider than tape
-        if img.width > MAX_LABEL_WIDTH:
-            r = MAX_LABEL_WIDTH / img.width
-            img = img.resize((MAX_LABEL_WIDTH, max(1, int(img.height * r))), Image.ANTIALIAS)
+        img = fit_label_width(img)
         x = (label_w - img.width) // 2
         label.paste(img, (x, y))
         y += img.height + LINE_GAP
@@ -215,9 +235,7 @@ def create_label(barcode_items, text_items, qr_items, output_path: Path):
     label = label.crop((0, 0, label_w, used_h))
 
     # final safety: ensure width <= MAX_LABEL_WIDTH
-    if label.width > MAX_LABEL_WIDTH:
-        r = MAX_LABEL_WIDTH / label.width
-        label = label.resize((MAX_LABEL_WIDTH, max(1, int(label.height * r))), Image.ANTIALIAS)
+    label = fit_label_width(label)
 
     label.save(output_path)
     log(f"Label saved: {output_path} (w={label.width}, h={label.height})")
@@ -241,51 +259,206 @@ def send_to_printer(image_path: Path):
     log("Print sent")
 
 
+# -------------------------
+# Item rendering (optionally in a process pool)
+# -------------------------
+RENDER_NAMES = {"barcode": "Barcode", "QR": "QR", "QRAAS": "AAS QR"}
+
+def render_item_image(ltype: str, value: str, output_stem: Path) -> Image.Image:
+    """
+    Render one item to disk and return the image create_label pastes: QR
+    caption applied and scaled to the tape width. Doing the caption and the
+    downscale here keeps them in the worker and makes the hand-back small.
+    """
+    if ltype == "barcode":
+        create_barcode(value, output_stem)
+    elif ltype == "QR":
+        create_qr_text(value, output_stem)
+    else:
+        create_qr_aas(value, output_stem)
+
+    img = Image.open(f"{output_stem}.png")
+    if ltype != "barcode":
+        img = overlay_text_on_qr(img, QR_OVERLAY_TEXT)
+    return fit_label_width(img)
+
+def export_shared_image(img: Image.Image):
+    """
+    Copy raw pixels into a shared-memory block and return a small handle
+    (name, mode, size, length) so the parent can rebuild the image without
+    pickling it.
+    """
+    data = img.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    handle = (shm.name, img.mode, img.size, len(data))
+    shm.close()
+    return handle
+
+def import_shared_image(handle) -> Image.Image:
+    name, mode, size, length = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # decode straight from the mapped segment; the image is the only copy
+        with shm.buf[:length] as view:
+            return Image.frombytes(mode, size, view)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def render_item_shared(ltype: str, value: str, output_stem: Path):
+    return export_shared_image(render_item_image(ltype, value, output_stem))
+
+def render_workers() -> int:
+    if RENDER_WORKERS > 0:
+        return RENDER_WORKERS
+    return os.cpu_count() or 1
+
+def render_items(jobs):
+    """
+    Render (item, labelType, value, stem) jobs and attach the result to item["image"].
+    With more than one worker, each item is rendered in its own process and the
+    pixels come back through shared memory.
+    """
+    workers = min(render_workers(), len(jobs))
+    if workers <= 1:
+        for it, ltype, val, stem in jobs:
+            it["image"] = render_item_image(ltype, val, stem)
+            log(f"{RENDER_NAMES[ltype]} created: {stem}.png")
+        return
+
+    log(f"Rendering {len(jobs)} items on {workers} workers")
+    # start the tracker before forking so workers and parent share it;
+    # otherwise each worker reports the blocks we unlink here as leaked
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_item_shared, ltype, val, stem) for _, ltype, val, stem in jobs]
+
+    # collect every result (even after a failure) so no shared block is left behind
+    error = None
+    for (it, ltype, _, stem), fut in zip(jobs, futures):
+        try:
+            handle = fut.result()
+        except Exception as e:
+            error = error or e
+            continue
+        it["image"] = import_shared_image(handle)
+        log(f"{RENDER_NAMES[ltype]} created: {stem}.png")
+    if error is not None:
+        raise error
+
+# -------------------------
+# Job-scoped artifacts
+# -------------------------
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def job_heartbeat(job_dir: Path):
+    (job_dir / JOB_ACTIVE_MARKER).touch()
+
+def job_abandoned(job_dir: Path, now: float) -> bool:
+    """
+    An unfinished job is abandoned once its heartbeat is older than
+    JOB_STALE_SECONDS and its owner process no longer exists.
+    """
+    active = job_dir / JOB_ACTIVE_MARKER
+    if not active.exists():
+        return now - job_dir.stat().st_mtime > JOB_STALE_SECONDS
+    if now - active.stat().st_mtime <= JOB_STALE_SECONDS:
+        return False
+    try:
+        pid = int(active.read_text().strip())
+    except ValueError:
+        return True
+    return not pid_alive(pid)
+
+def prune_jobs():
+    """
+    Keep the JOB_RETENTION most recent finished job directories and drop
+    abandoned unfinished ones. Directories of jobs still running are left alone.
+    """
+    finished, now = [], time.time()
+    for job_dir in JOBS_DIR.iterdir():
+        try:
+            if not job_dir.is_dir():
+                continue
+            marker = job_dir / JOB_DONE_MARKER
+            if marker.exists():
+                finished.append((marker.stat().st_mtime, job_dir))
+            elif job_abandoned(job_dir, now):
+                shutil.rmtree(job_dir, ignore_errors=True)
+        except FileNotFoundError:
+            continue  # removed by another job's prune
+
+    finished.sort(reverse=True)
+    for _, job_dir in finished[max(0, JOB_RETENTION):]:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+@contextmanager
+def job_workspace():
+    """Create a private directory for one job's artifacts and retire it afterwards."""
+    ensure_dirs()
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    job_dir = JOBS_DIR / job_id
+    job_dir.mkdir()
+    (job_dir / JOB_ACTIVE_MARKER).write_text(str(os.getpid()))
+    log(f"Job {job_id} workspace: {job_dir}")
+    try:
+        yield job_dir
+    finally:
+        (job_dir / JOB_DONE_MARKER).touch()
+        (job_dir / JOB_ACTIVE_MARKER).unlink(missing_ok=True)
+        prune_jobs()
+
 # -------------------------
 # Payload handling
 # -------------------------
 def process_payload(payload: dict):
-    ensure_dirs()
+    with job_workspace() as job_dir:
+        process_payload_in(payload, job_dir)
 
+def process_payload_in(payload: dict, job_dir: Path):
     items = payload.get("labelItems", [])
     qty = int(payload.get("qty", 1))
 
     barcode_items, text_items, qr_items = [], [], []
+    render_jobs = []
 
-    for it in items:
+    for idx, it in enumerate(items):
         ltype = it.get("labelType")
         key = str(it.get("labelKey", ""))
         val = str(it.get("labelValue", ""))
 
         if ltype == "barcode":
-            stem = BARCODES_DIR / f"barcode-{key}-{val}"
-            create_barcode(val, stem)
+            stem = job_dir / f"barcode-{idx}"
             it["imgPath"] = str(stem)
             barcode_items.append(it)
-            log(f"Barcode created: {stem}.png")
+            render_jobs.append((it, ltype, val, stem))
 
-        elif ltype == "QR":
-            stem = QR_DIR / f"QR-{key}"
-            create_qr_text(val, stem)
+        elif ltype in ("QR", "QRAAS"):
+            stem = job_dir / f"QR-{idx}"
             it["imgPath"] = str(stem)
             qr_items.append(it)
-            log(f"QR created: {stem}.png")
-
-        elif ltype == "QRAAS":
-            stem = QR_DIR / f"QR-{key}"
-            create_qr_aas(val, stem)
-            it["imgPath"] = str(stem)
-            qr_items.append(it)
-            log(f"AAS QR created: {stem}.png")
+            render_jobs.append((it, ltype, val, stem))
 
         elif ltype == "text":
             text_items.append(it)
             log(f"Text added: {key or '[text]'} -> {val}")
 
-    label_png = OUTPUT_DIR / "label.png"
+    render_items(render_jobs)
+    job_heartbeat(job_dir)
+
+    label_png = job_dir / "label.png"
     create_label(barcode_items, text_items, qr_items, label_png)
 
     for i in range(qty):
+        job_heartbeat(job_dir)
         log(f"Printing copy {i+1}/{qty}")
         send_to_printer(label_png)
         time.sleep(0.4)
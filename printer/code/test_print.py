@@ -0,0 +1,115 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("barcode")
+pytest.importorskip("brother_ql")
+pytest.importorskip("qrcode")
+
+from PIL import Image  # noqa: E402
+
+HERE = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def printmod(tmp_path, monkeypatch):
+    # print.py reads CODE_BASE at import, so load a fresh copy per test
+    monkeypatch.setenv("CODE_BASE", str(tmp_path))
+    spec = importlib.util.spec_from_file_location("print_under_test", HERE / "print.py")
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, spec.name, module)
+    spec.loader.exec_module(module)
+    module.ensure_dirs()
+    return module
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _job_dir(printmod, name, pid=None, age=0.0, done=False):
+    job_dir = printmod.JOBS_DIR / name
+    job_dir.mkdir()
+    stamp = time.time() - age
+    if pid is not None:
+        active = job_dir / printmod.JOB_ACTIVE_MARKER
+        active.write_text(str(pid))
+        os.utime(active, (stamp, stamp))
+    if done:
+        (job_dir / printmod.JOB_DONE_MARKER).touch()
+    os.utime(job_dir, (stamp, stamp))
+    return job_dir
+
+
+def test_live_pid_with_stale_heartbeat_is_kept(printmod):
+    job_dir = _job_dir(printmod, "running", pid=os.getpid(), age=printmod.JOB_STALE_SECONDS + 60)
+    printmod.prune_jobs()
+    assert job_dir.exists()
+
+
+def test_dead_pid_with_stale_heartbeat_is_removed(printmod):
+    job_dir = _job_dir(printmod, "killed", pid=_dead_pid(), age=printmod.JOB_STALE_SECONDS + 60)
+    printmod.prune_jobs()
+    assert not job_dir.exists()
+
+
+def test_dead_pid_with_fresh_heartbeat_is_kept(printmod):
+    job_dir = _job_dir(printmod, "other-namespace", pid=_dead_pid())
+    printmod.prune_jobs()
+    assert job_dir.exists()
+
+
+def test_unmarked_dir_falls_back_to_mtime(printmod):
+    stale = _job_dir(printmod, "stale", age=printmod.JOB_STALE_SECONDS + 60)
+    fresh = _job_dir(printmod, "fresh")
+    printmod.prune_jobs()
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_retention_zero_removes_finished_job(printmod, monkeypatch):
+    monkeypatch.setattr(printmod, "JOB_RETENTION", 0)
+    with printmod.job_workspace() as job_dir:
+        active = job_dir / printmod.JOB_ACTIVE_MARKER
+        assert active.read_text() == str(os.getpid())
+    assert not job_dir.exists()
+
+
+def test_retention_keeps_newest_finished_jobs(printmod, monkeypatch):
+    monkeypatch.setattr(printmod, "JOB_RETENTION", 2)
+    oldest = _job_dir(printmod, "a", done=True)
+    older = _job_dir(printmod, "b", done=True)
+    for age, job_dir in ((300, oldest), (200, older)):
+        stamp = time.time() - age
+        os.utime(job_dir / printmod.JOB_DONE_MARKER, (stamp, stamp))
+
+    with printmod.job_workspace() as newest:
+        pass
+
+    assert not oldest.exists()
+    assert older.exists()
+    assert newest.exists()
+
+
+@pytest.mark.parametrize("mode", ["1", "L", "RGB"])
+def test_shared_image_round_trip(printmod, mode):
+    img = Image.new(mode, (37, 23), "white")
+    img.paste(Image.new(mode, (10, 10), "black"), (5, 5))
+
+    handle = printmod.export_shared_image(img)
+    restored = printmod.import_shared_image(handle)
+
+    assert restored.mode == img.mode
+    assert restored.size == img.size
+    assert restored.tobytes() == img.tobytes()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=handle[0])